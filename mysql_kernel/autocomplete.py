@@ -143,14 +143,66 @@ class SQLAutocompleter:
         table_names = self.extract_table_names(code)
         columns = []
         for table in table_names:
-            schema, table_name = self.split_schema_table(table)
-            try:
-                table_columns = [col["name"] for col in self.inspector.get_columns(table_name, schema=schema)]
-                columns.extend(table_columns)
-            except Exception:
-                pass  # Ignore missing tables
+            columns.extend(self.get_table_columns(table))  # Missing tables give no columns
         return columns
 
+    def get_table_columns(self, table):
+        """
+        Returns the column names of a single table from the inspector's cached metadata.
+
+        Parameters:
+        - table (str): Table name (could be schema-qualified like 'schema.table').
+
+        Returns:
+        - list: Column names, or an empty list if the table is unknown.
+        """
+        schema, table_name = self.split_schema_table(table)
+        try:
+            return [col["name"] for col in self.inspector.get_columns(table_name, schema=schema)]
+        except Exception:
+            return []
+
+    def get_primary_key(self, table):
+        """
+        Returns the primary key columns of a table.
+
+        Parameters:
+        - table (str): Table name (could be schema-qualified like 'schema.table').
+
+        Returns:
+        - list: Primary key column names, or an empty list if there is none.
+        """
+        schema, table_name = self.split_schema_table(table)
+        try:
+            pk = self.inspector.get_pk_constraint(table_name, schema=schema)
+        except Exception:
+            return []
+        return (pk or {}).get("constrained_columns") or []
+
+    def get_indexed_columns(self, table):
+        """
+        Returns the leading column of every index (primary key included) of a table.
+
+        Parameters:
+        - table (str): Table name (could be schema-qualified like 'schema.table').
+
+        Returns:
+        - set: Lowercase column names that already lead an index.
+        """
+        schema, table_name = self.split_schema_table(table)
+        leading = set()
+        pk = self.get_primary_key(table)
+        if pk:
+            leading.add(pk[0].lower())
+        try:
+            for index in self.inspector.get_indexes(table_name, schema=schema):
+                columns = [col for col in index.get("column_names", []) if col]
+                if columns:
+                    leading.add(columns[0].lower())
+        except Exception:
+            pass  # Dialects without index reflection
+        return leading
+
     def get_functions(self):
         """Returns common SQL functions."""
         return [
@@ -0,0 +1,250 @@
+import re
+import time
+import sqlalchemy as sa
+from .i18n import get_translator
+
+_ = get_translator()
+
+__all__ = ['ChunkedExecutor', 'parse_chunked_options']
+
+DEFAULT_OPTIONS = {
+    'size': 1000,       # initial rows per chunk
+    'sleep': 0,         # pause between chunks, in milliseconds
+    'target': 500,      # target latency per chunk, in milliseconds
+    'max-size': 50000,  # upper limit for the adapted chunk size
+    'max-lag': None,    # maximum replica lag, in seconds
+    'replica': None,    # connection url of the replica to watch
+}
+
+LAG_CHECK_INTERVAL = 1.0
+
+
+def parse_chunked_options(line):
+    """
+    Parses the options of a `%%chunked` line.
+
+    Parameters:
+    - line (str): First line of the cell, e.g. `%%chunked --size 500 --sleep 100`.
+
+    Returns:
+    - dict: Options with the defaults filled in.
+    """
+    options = dict(DEFAULT_OPTIONS)
+    rest = re.sub(r'^\s*%%chunked', '', line)
+    for name, value in re.findall(r'--([\w-]+)(?:[ =]+(?!--)(\S+))?', rest):
+        if name not in options:
+            raise ValueError(_('Unknown %%%%chunked option: --%s') % name)
+        if not value:
+            raise ValueError(_('Missing value for the %%%%chunked option --%s') % name)
+        if name == 'replica':
+            options[name] = value.replace('mysql://', 'mysql+pymysql://', 1) if value.startswith('mysql://') else value
+            continue
+        try:
+            number = float(value) if name == 'max-lag' else int(value)
+        except ValueError:
+            number = -1
+        if name in ('sleep', 'max-lag') and number < 0:
+            raise ValueError(_('--%s must be zero or a positive number') % name)
+        if name in ('size', 'target', 'max-size') and number < 1:
+            raise ValueError(_('--%s must be a positive number') % name)
+        options[name] = number
+    if options['max-lag'] is not None and options['replica'] is None:
+        raise ValueError(_('--max-lag requires --replica <connection url> to measure the lag'))
+    if options['replica'] is not None and options['max-lag'] is None:
+        raise ValueError(_('--replica requires --max-lag <seconds> to know when to wait'))
+    return options
+
+
+def top_level_clauses(statement):
+    """
+    Finds the WHERE, ORDER BY and LIMIT keywords outside parentheses, string literals and quoted names.
+
+    Returns:
+    - list: (keyword, start, end) for each one, or None when the quotes or parentheses are unbalanced.
+    """
+    clauses = []
+    keyword = re.compile(r'\b(where|order\s+by|limit)\b', re.IGNORECASE)
+    depth, quote, i = 0, None, 0
+    while i < len(statement):
+        char = statement[i]
+        if quote:
+            if char == '\\' and quote != '`':
+                i += 1
+            elif char == quote:
+                if statement[i + 1:i + 2] == quote:
+                    i += 1  # Doubled quote inside the literal
+                else:
+                    quote = None
+        elif char in '\'"`':
+            quote = char
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+            if depth < 0:
+                return None
+        elif depth == 0:
+            match = keyword.match(statement, i)
+            if match:
+                clauses.append((re.sub(r'\s+', ' ', match.group(1).lower()), match.start(), match.end()))
+                i = match.end()
+                continue
+        i += 1
+    if quote or depth:
+        return None
+    return clauses
+
+
+class ChunkedExecutor:
+    """
+    Runs a single table UPDATE/DELETE in primary key ranges, committing each range separately.
+
+    The chunk size is adapted after every chunk so that each one takes about `target` ms,
+    and the executor waits while the replica lags more than `max_lag` seconds.
+    """
+
+    def __init__(self, engine, statement, autocompleter, size=1000, sleep=0, target=500, max_size=50000,
+                 max_lag=None, replica=None):
+        statement = statement.strip()
+        unsupported = ValueError(_('%%chunked only supports single table UPDATE and DELETE statements.'))
+        match = re.match(r'(?:delete\s+from\s+([^\s;()]+)|update\s+([^\s;()]+)\s+set\s)', statement, re.IGNORECASE)
+        clauses = top_level_clauses(statement)
+        if not match or clauses is None:
+            raise unsupported
+        if any(clause != 'where' for clause, _start, _end in clauses):
+            raise ValueError(_('%%chunked statements cannot have ORDER BY or LIMIT.'))
+        if len(clauses) > 1:
+            raise unsupported
+        self.engine = engine
+        self.table = match.group(1) or match.group(2)
+        self.head, self.condition = statement, None
+        if clauses:
+            _clause, start, end = clauses[0]
+            self.head, self.condition = statement[:start].rstrip(), statement[end:].strip()
+        # Nothing may follow the table of a DELETE (USING, joins...) and an UPDATE needs assignments
+        if (match.group(1) and self.head != match.group(0)) or (match.group(2) and self.head == match.group(0).rstrip()):
+            raise unsupported
+        if clauses and not self.condition:
+            raise unsupported
+        key = autocompleter.get_primary_key(self.table)
+        if not key:
+            raise ValueError(_('Unable to find the primary key of table %s to walk in chunks.') % self.table)
+        assignments = re.findall(r'(?:\bset|,)\s*(?:[\w`"]+\.)?[`"]?(\w+)[`"]?\s*=', self.head, re.IGNORECASE)
+        if {column.lower() for column in assignments} & {column.lower() for column in key}:
+            # Rows moved forward would be found again by the next ranges
+            raise ValueError(_('%%%%chunked cannot update the primary key columns of %s.') % self.table)
+        self.keys = [engine.dialect.identifier_preparer.quote(column) for column in key]
+        self.max_size = max_size
+        self.size = min(size, max_size)
+        self.sleep = sleep / 1000
+        self.target = target / 1000
+        self.max_lag = max_lag
+        self.replica_url = replica
+        self.replica = None
+        self.rows = 0  # Rows affected by the committed chunks, kept up to date for interruptions
+
+    def where(self, *predicates):
+        predicates = [f'({self.condition})'] * bool(self.condition) + list(predicates)
+        return ' WHERE ' + ' AND '.join(predicates) if predicates else ''
+
+    def key_predicate(self, operator, name, values, params):
+        """
+        Compares the key with `values`, using a row constructor like `(a, b) > (:low_0, :low_1)`
+        for composite keys, and adds the bind parameters to `params`.
+        """
+        binds = [f':{name}_{i}' for i in range(len(self.keys))]
+        params.update({f'{name}_{i}': value for i, value in enumerate(values)})
+        if len(self.keys) == 1:
+            return f'{self.keys[0]} {operator} {binds[0]}'
+        return f"({', '.join(self.keys)}) {operator} ({', '.join(binds)})"
+
+    def key_bounds(self):
+        """Returns the minimum and maximum of the leading key column, used to report progress."""
+        query = f'SELECT MIN({self.keys[0]}), MAX({self.keys[0]}) FROM {self.table}{self.where()}'
+        with self.engine.connect() as con:
+            return tuple(con.execute(sa.sql.text(query)).fetchone())
+
+    def next_boundary(self, low, size):
+        """Returns the key tuple closing the next range of at most `size` matching rows, or None when done."""
+        params = {}
+        predicates = [self.key_predicate('>', 'low', low, params)] if low is not None else []
+        columns = ', '.join(f'{key} AS chunk_key_{i}' for i, key in enumerate(self.keys))
+        descending = ', '.join(f'chunk_key_{i} DESC' for i in range(len(self.keys)))
+        query = (f'SELECT * FROM (SELECT {columns} FROM {self.table}{self.where(*predicates)} '
+                 f"ORDER BY {', '.join(self.keys)} LIMIT {int(size)}) AS chunk ORDER BY {descending} LIMIT 1")
+        with self.engine.connect() as con:
+            row = con.execute(sa.sql.text(query), params).fetchone()
+        return tuple(row) if row is not None else None
+
+    def run_chunk(self, low, high):
+        params = {}
+        predicates = [self.key_predicate('<=', 'high', high, params)]
+        if low is not None:
+            predicates.insert(0, self.key_predicate('>', 'low', low, params))
+        with self.engine.begin() as con:
+            rows = max(con.execute(sa.sql.text(self.head + self.where(*predicates)), params).rowcount, 0)
+        self.rows += rows
+        return rows
+
+    def replica_lag(self):
+        """Returns the replica lag in seconds, as reported by SHOW REPLICA STATUS."""
+        with self.replica.connect() as con:
+            for query, column in (('SHOW REPLICA STATUS', 'Seconds_Behind_Source'),
+                                  ('SHOW SLAVE STATUS', 'Seconds_Behind_Master')):
+                try:
+                    row = con.execute(sa.sql.text(query)).mappings().first()
+                except sa.exc.DBAPIError:
+                    continue
+                if row is None or row[column] is None:
+                    raise ValueError(_('Replication is not running on the replica, unable to measure the lag.'))
+                return float(row[column])
+        raise ValueError(_('Unable to read the replica status.'))
+
+    def adapt_size(self, elapsed):
+        """Scales the chunk size towards the target latency, at most halving or doubling it, up to `max_size`."""
+        scaled = int(self.size * self.target / max(elapsed, 1e-3))
+        self.size = max(1, min(max(scaled, self.size // 2), self.size * 2, self.max_size))
+
+    def run(self):
+        """
+        Executes the statement chunk by chunk.
+
+        Yields:
+        - dict: Progress after every chunk and while waiting for the replica, with the keys
+          `chunks`, `rows`, `size` (of the next chunk), `elapsed`, `last_key`, `progress` (0 to 1, or None) and `lag`.
+        """
+        self.replica = sa.create_engine(self.replica_url) if self.replica_url else None
+        try:
+            first, last = self.key_bounds()
+            if first is None:
+                return
+            numeric = isinstance(first, (int, float)) and isinstance(last, (int, float)) and last > first
+            state = {'chunks': 0, 'rows': 0, 'size': None, 'elapsed': None,
+                     'last_key': None, 'progress': 0.0 if numeric else None, 'lag': None}
+            low = None
+            while True:
+                high = self.next_boundary(low, self.size)
+                if high is None:
+                    break
+                start = time.monotonic()
+                self.run_chunk(low, high)
+                state['rows'] = self.rows
+                elapsed = time.monotonic() - start
+                self.adapt_size(elapsed)
+                last_key = high[0] if len(high) == 1 else high
+                state.update(chunks=state['chunks'] + 1, size=self.size, elapsed=elapsed, last_key=last_key)
+                if numeric:
+                    state['progress'] = min((high[0] - first) / (last - first), 1.0)
+                yield dict(state)
+                low = high
+                if self.max_lag is not None:
+                    state['lag'] = self.replica_lag()
+                    while state['lag'] > self.max_lag:
+                        yield dict(state, waiting=True)
+                        time.sleep(max(self.sleep, LAG_CHECK_INTERVAL))
+                        state['lag'] = self.replica_lag()
+                if self.sleep:
+                    time.sleep(self.sleep)
+        finally:
+            if self.replica is not None:
+                self.replica.dispose()
@@ -0,0 +1,457 @@
+import html
+import json
+import re
+import sqlalchemy as sa
+from .i18n import get_translator
+
+_ = get_translator()
+
+__all__ = ['PlanNode', 'explain_query', 'suggest_indexes', 'render_html', 'render_text']
+
+FULL_SCAN = 'full_scan'
+FILESORT = 'filesort'
+TEMPORARY = 'temporary'
+MISESTIMATE = 'misestimate'
+
+# Estimated and actual rows further apart than this factor are flagged
+MISESTIMATE_FACTOR = 10
+
+NUMBER = r'\d+(?:\.\d+)?(?:e[+-]?\d+)?'
+
+# Keys of a MySQL `EXPLAIN FORMAT=JSON` (version 1) document that hold plan operations
+MYSQL_OPERATIONS = {
+    'query_block', 'table', 'ordering_operation', 'grouping_operation',
+    'duplicates_removal', 'union_result', 'materialized_from_subquery',
+    'buffer_result', 'windowing',
+}
+MYSQL_OPERATION_LISTS = {
+    'nested_loop', 'query_specifications', 'attached_subqueries',
+    'optimized_away_subqueries', 'select_list_subqueries', 'having_subqueries',
+    'order_by_subqueries', 'group_by_subqueries',
+}
+
+SQL_WORDS = {
+    'and', 'or', 'not', 'in', 'is', 'null', 'like', 'between', 'exists', 'asc', 'desc',
+    'true', 'false', 'case', 'when', 'then', 'else', 'end', 'select', 'from', 'as',
+}
+
+
+class PlanNode:
+    """
+    A single operation of a query plan.
+
+    Costs are cumulative (they include the children), as reported by the databases.
+    Times are in milliseconds.
+    """
+
+    def __init__(self, label, table=None, cost=None, est_rows=None, act_rows=None, loops=None, time=None):
+        self.label = label
+        self.table = table
+        self.cost = cost
+        self.est_rows = est_rows
+        self.act_rows = act_rows
+        self.loops = loops
+        self.time = time
+        self.warnings = []
+        self.children = []
+
+    def walk(self, depth=0):
+        """Yields (depth, node) for this node and all its descendants."""
+        yield depth, self
+        for child in self.children:
+            yield from child.walk(depth + 1)
+
+    def self_weight(self, metric):
+        """Returns the cost (or time) spent in this node alone, excluding its children."""
+        own = getattr(self, metric)
+        if own is None:
+            return 0.0
+        children = sum(getattr(child, metric) or 0.0 for child in self.children)
+        return max(own - children, 0.0)
+
+    def flag_misestimate(self):
+        if self.est_rows is None or self.act_rows is None:
+            return
+        low, high = sorted((self.est_rows, self.act_rows))
+        if high >= MISESTIMATE_FACTOR * max(low, 1):
+            self.warnings.append(MISESTIMATE)
+
+
+def to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def explain_query(engine, query, analyze=False):
+    """
+    Runs the dialect specific EXPLAIN for a query and parses it into a plan tree.
+
+    Parameters:
+    - engine: SQLAlchemy engine connected to a database.
+    - query (str): Query to be explained.
+    - analyze (bool): Whether to execute the query and collect actual rows and times.
+
+    Returns:
+    - PlanNode: Root of the plan tree.
+    """
+    dialect = engine.dialect.name
+    with engine.connect() as con:
+        if dialect in ('mysql', 'mariadb'):
+            if analyze:
+                if getattr(engine.dialect, 'is_mariadb', False):
+                    raise ValueError(_('EXPLAIN ANALYZE is not supported by %s, use %%explain without analyze.') % 'MariaDB')
+                text = con.execute(sa.sql.text(f'EXPLAIN ANALYZE {query}')).scalar()
+                return parse_mysql_analyze(text)
+            document = con.execute(sa.sql.text(f'EXPLAIN FORMAT=JSON {query}')).scalar()
+            return parse_mysql_json(json.loads(document))
+        if dialect == 'duckdb':
+            options = 'ANALYZE, FORMAT JSON' if analyze else 'FORMAT JSON'
+            rows = con.execute(sa.sql.text(f'EXPLAIN ({options}) {query}')).fetchall()
+            return parse_duckdb_json(json.loads(rows[-1][-1]))
+        if dialect == 'sqlite':
+            if analyze:
+                raise ValueError(_('EXPLAIN ANALYZE is not supported by %s, use %%explain without analyze.') % 'SQLite')
+            rows = con.execute(sa.sql.text(f'EXPLAIN QUERY PLAN {query}')).fetchall()
+            return parse_sqlite_plan(rows)
+    raise ValueError(_('%%explain is not supported for the %s dialect.') % dialect)
+
+
+def parse_mysql_json(document):
+    """Parses the output of MySQL `EXPLAIN FORMAT=JSON`, both the version 1 and 2 formats."""
+    if 'query_block' in document:
+        return mysql_json_node('query_block', document['query_block'])
+    return mysql_json_v2_node(document)
+
+
+def mysql_json_node(name, obj):
+    cost_info = obj.get('cost_info', {})
+    if name == 'table':
+        access_type = obj.get('access_type', '')
+        label = f"{obj.get('table_name', '?')} ({access_type})"
+        if obj.get('key'):
+            label += f" key={obj['key']}"
+        read_cost, eval_cost = to_float(cost_info.get('read_cost')), to_float(cost_info.get('eval_cost'))
+        # read_cost and eval_cost are the table's own costs, its children (a materialized subquery) are added below
+        own_cost = read_cost + eval_cost if read_cost is not None and eval_cost is not None else None
+        node = PlanNode(label, table=obj.get('table_name'),
+                        est_rows=to_float(obj.get('rows_examined_per_scan')))
+        if access_type == 'ALL':
+            node.warnings.append(FULL_SCAN)
+    else:
+        # query_cost is cumulative, sort_cost is only the sort's own cost
+        node = PlanNode(name.replace('_', ' '), cost=to_float(cost_info.get('query_cost')))
+        own_cost = to_float(cost_info.get('sort_cost'))
+    if obj.get('using_filesort'):
+        node.warnings.append(FILESORT)
+    if obj.get('using_temporary_table'):
+        node.warnings.append(TEMPORARY)
+
+    for key, value in obj.items():
+        if key in MYSQL_OPERATIONS and isinstance(value, dict):
+            node.children.append(mysql_json_node(key, value))
+        elif key in MYSQL_OPERATION_LISTS and isinstance(value, list):
+            group = PlanNode(key.replace('_', ' '))
+            for item in value:
+                for item_key, item_value in item.items():
+                    if item_key in MYSQL_OPERATIONS and isinstance(item_value, dict):
+                        group.children.append(mysql_json_node(item_key, item_value))
+            group.cost = sum(child.cost or 0.0 for child in group.children) or None
+            node.children.append(group)
+    if node.cost is None:
+        children_cost = sum(child.cost or 0.0 for child in node.children)
+        if own_cost is not None:
+            node.cost = own_cost + children_cost
+        elif node.children:
+            node.cost = children_cost or None
+    return node
+
+
+def mysql_json_v2_node(obj):
+    operation = obj.get('operation', '?')
+    node = PlanNode(operation, table=obj.get('table_name') or obj.get('alias'),
+                    cost=to_float(obj.get('estimated_total_cost')),
+                    est_rows=to_float(obj.get('estimated_rows')))
+    classify_operation(node, operation)
+    for child in obj.get('inputs', []):
+        node.children.append(mysql_json_v2_node(child))
+    return node
+
+
+def classify_operation(node, operation):
+    """Flags full scans, sorts and temporary tables from a MySQL tree style operation."""
+    if operation.startswith('Table scan on'):
+        node.warnings.append(FULL_SCAN)
+        if node.table is None:
+            node.table = re.match(r'Table scan on (\S+)', operation).group(1)
+    elif operation.startswith('Sort') and not operation.startswith('Sort row IDs'):
+        node.warnings.append(FILESORT)
+    if 'temporary' in operation.lower() or operation.startswith('Materialize'):
+        node.warnings.append(TEMPORARY)
+
+
+def parse_mysql_analyze(text):
+    """Parses the indented tree returned by MySQL `EXPLAIN ANALYZE`."""
+    root = PlanNode(_('Query'))
+    stack = [(-1, root)]
+    for line in text.splitlines():
+        match = re.match(r'( *)-> (.*)', line)
+        if not match:
+            if line.strip() and len(stack) > 1:
+                stack[-1][1].label += ' ' + line.strip()
+            continue
+        indent, body = len(match.group(1)), match.group(2)
+        operation = re.split(r'  \(', body)[0]
+        node = PlanNode(operation)
+        estimate = re.search(rf'\(cost=(?:{NUMBER}\.\.)?({NUMBER}) rows=({NUMBER})\)', body)
+        if estimate:
+            node.cost, node.est_rows = float(estimate.group(1)), float(estimate.group(2))
+        actual = re.search(rf'\(actual time={NUMBER}\.\.({NUMBER}) rows=({NUMBER}) loops=(\d+)\)', body)
+        if actual:
+            node.loops = int(actual.group(3))
+            node.time = float(actual.group(1)) * node.loops
+            node.act_rows = float(actual.group(2))
+        classify_operation(node, operation)
+        node.flag_misestimate()
+        while stack[-1][0] >= indent:
+            stack.pop()
+        stack[-1][1].children.append(node)
+        stack.append((indent, node))
+    if len(root.children) == 1:
+        return root.children[0]
+    return root
+
+
+def parse_duckdb_json(document):
+    """Parses the output of DuckDB `EXPLAIN (FORMAT JSON)`, analyzed or not."""
+    if isinstance(document, list):
+        nodes = [duckdb_node(item) for item in document]
+        if len(nodes) == 1:
+            return nodes[0]
+        root = PlanNode(_('Query'))
+        root.children = nodes
+        return root
+    # Profiling output: the root is the query itself and the operators are its children.
+    # Its latency is left out, planning and overhead time would dwarf the operators.
+    root = PlanNode(_('Query'))
+    root.children = [duckdb_node(child) for child in document.get('children', [])]
+    return root
+
+
+def duckdb_node(obj):
+    name = obj.get('name') or obj.get('operator_name') or obj.get('operator_type') or '?'
+    name = name.strip()
+    extra_info = obj.get('extra_info', {})
+    if isinstance(extra_info, dict):
+        table = extra_info.get('Table')
+        estimate = extra_info.get('Estimated Cardinality')
+    else:
+        table_match = re.search(r'Table: *(\S+)', extra_info)
+        table = table_match.group(1) if table_match else None
+        estimate_match = re.search(r'(?:EC|Estimated Cardinality): *~?(\d+)', extra_info)
+        estimate = estimate_match.group(1) if estimate_match else None
+        if table is None and name in ('SEQ_SCAN', 'TABLE_SCAN'):
+            table = extra_info.strip().split('\n')[0].strip() or None
+    estimate = to_float(str(estimate).lstrip('~')) if estimate is not None else None
+    timing = to_float(obj.get('operator_timing', obj.get('timing')))
+    node = PlanNode(name if not table else f'{name} {table}', table=table, est_rows=estimate,
+                    act_rows=to_float(obj.get('operator_cardinality', obj.get('cardinality'))),
+                    time=timing * 1000 if timing is not None else None)
+    if name in ('SEQ_SCAN', 'TABLE_SCAN'):
+        node.warnings.append(FULL_SCAN)
+    elif name in ('ORDER_BY', 'TOP_N'):
+        node.warnings.append(FILESORT)
+    node.flag_misestimate()
+    node.children = [duckdb_node(child) for child in obj.get('children', [])]
+    if node.time is not None and node.children:
+        # DuckDB reports operator timings exclusive of the children
+        node.time += sum(child.time or 0.0 for child in node.children)
+    return node
+
+
+def parse_sqlite_plan(rows):
+    """Builds a tree from the (id, parent, notused, detail) rows of SQLite `EXPLAIN QUERY PLAN`."""
+    root = PlanNode(_('Query'))
+    nodes = {0: root}
+    for row in rows:
+        node_id, parent, detail = row[0], row[1], row[-1]
+        table_match = re.match(r'(?:SCAN|SEARCH)(?: TABLE)? (\S+)', detail)
+        node = PlanNode(detail, table=table_match.group(1) if table_match else None)
+        if detail.startswith('SCAN') and ' USING ' not in detail:
+            node.warnings.append(FULL_SCAN)
+        elif detail.startswith('USE TEMP B-TREE'):
+            node.warnings.append(FILESORT if 'ORDER BY' in detail else TEMPORARY)
+        nodes.get(parent, root).children.append(node)
+        nodes[node_id] = node
+    return root
+
+
+def table_aliases(query):
+    """Maps table names and their aliases (lowercase) to the table names in a query."""
+    aliases = {}
+    pattern = r'(?:FROM|JOIN|UPDATE)\s+([\w.]+)(?:\s+(?:AS\s+)?(\w+))?'
+    for table, alias in re.findall(pattern, query, re.IGNORECASE):
+        aliases[table.lower()] = table
+        aliases[table.split('.')[-1].lower()] = table
+        if alias and alias.lower() not in SQL_WORDS and alias.upper() not in (
+                'WHERE', 'JOIN', 'INNER', 'LEFT', 'RIGHT', 'FULL', 'CROSS', 'ON', 'GROUP',
+                'ORDER', 'LIMIT', 'SET', 'USING', 'NATURAL', 'STRAIGHT_JOIN', 'HAVING'):
+            aliases[alias.lower()] = table
+    return aliases
+
+
+def clause_columns(query, keywords):
+    """Returns the (qualifier, column) references found in the given clauses of a query."""
+    query = re.sub(r"'(?:[^']|'')*'", "''", query)
+    stop = r'(?=\bWHERE\b|\bGROUP\s+BY\b|\bORDER\s+BY\b|\bHAVING\b|\bLIMIT\b|\bUNION\b|\b(?:INNER\s+|LEFT\s+|RIGHT\s+|CROSS\s+)?JOIN\b|$)'
+    references = []
+    for keyword in keywords:
+        for clause in re.findall(rf'\b{keyword}\b(.*?){stop}', query, re.IGNORECASE | re.DOTALL):
+            for qualifier, column in re.findall(r'(?:`?(\w+)`?\.)?`?([A-Za-z_]\w*)\b`?(?!\s*\()', clause):
+                if column.lower() not in SQL_WORDS:
+                    references.append((qualifier.lower() or None, column))
+    return references
+
+
+def suggest_indexes(root, query, autocompleter, max_columns=3):
+    """
+    Suggests candidate indexes for the tables the plan reads with full scans.
+
+    Only columns known to the autocompleter's metadata are used: filter and join columns
+    come first, followed by sort and grouping columns when the plan needs a filesort or
+    a temporary table.
+
+    Returns:
+    - list: `CREATE INDEX` statements.
+    """
+    nodes = [node for _depth, node in root.walk()]
+    aliases = table_aliases(query)
+    references = clause_columns(query, (r'WHERE', r'ON'))
+    if any(FILESORT in node.warnings or TEMPORARY in node.warnings for node in nodes):
+        references += clause_columns(query, (r'GROUP\s+BY', r'ORDER\s+BY'))
+
+    suggestions = []
+    seen_tables = set()
+    for node in nodes:
+        if FULL_SCAN not in node.warnings or not node.table:
+            continue
+        # DuckDB reports catalog qualified names, e.g. `memory.main.orders`
+        name = node.table.strip('`')
+        table = aliases.get(name.lower()) or aliases.get(name.split('.')[-1].lower(), name)
+        if table.lower() in seen_tables:
+            continue
+        seen_tables.add(table.lower())
+        known = {col.lower(): col for col in autocompleter.get_table_columns(table)}
+        columns = []
+        for qualifier, column in references:
+            if qualifier and aliases.get(qualifier, qualifier).lower() != table.lower():
+                continue
+            name = known.get(column.lower())
+            if name and name not in columns:
+                columns.append(name)
+        columns = columns[:max_columns]
+        if not columns or columns[0].lower() in autocompleter.get_indexed_columns(table):
+            continue
+        table_name = table.split('.')[-1]
+        index_name = f"idx_{table_name}_{'_'.join(columns)}"[:64]
+        suggestions.append(f"CREATE INDEX {index_name} ON {table} ({', '.join(columns)});")
+    return suggestions
+
+
+def warning_labels():
+    return {
+        FULL_SCAN: _('full table scan'),
+        FILESORT: _('filesort'),
+        TEMPORARY: _('temporary table'),
+        MISESTIMATE: _('row estimate off'),
+    }
+
+
+def format_number(value):
+    if value is None:
+        return '-'
+    if value == int(value):
+        return f'{int(value):,}'
+    return f'{value:,.2f}'
+
+
+def hotspot_metric(root):
+    """Uses actual times when the plan was analyzed and estimated costs otherwise."""
+    if any(node.time is not None for _depth, node in root.walk()):
+        return 'time'
+    return 'cost'
+
+
+def node_details(node):
+    details = []
+    if node.cost is not None:
+        details.append(f'cost={format_number(node.cost)}')
+    if node.est_rows is not None or node.act_rows is not None:
+        rows = f'rows={format_number(node.est_rows)}'
+        if node.act_rows is not None:
+            rows += f' / {format_number(node.act_rows)}'
+        details.append(rows)
+    if node.loops is not None:
+        details.append(f'loops={node.loops}')
+    if node.time is not None:
+        details.append(f'time={format_number(node.time)}ms')
+    return details
+
+
+def render_html(root, suggestions):
+    """Renders the plan tree as nested lists shaded by each node's share of the total cost."""
+    metric = hotspot_metric(root)
+    labels = warning_labels()
+    total = sum(node.self_weight(metric) for _depth, node in root.walk()) or 1.0
+
+    def render(node):
+        share = node.self_weight(metric) / total
+        badges = ''.join(
+            f'<span style="background:#ff5555;color:white;border-radius:3px;padding:0 4px;margin-left:4px">'
+            f'{html.escape(labels[warning])}</span>'
+            for warning in node.warnings)
+        details = html.escape(' '.join(node_details(node)))
+        percent = f' <b>{share:.0%}</b>' if share >= 0.01 else ''
+        item = (f'<li><span style="background:rgba(255,85,85,{share * 0.6:.2f})">'
+                f'{html.escape(node.label)}</span> <small style="color:#6272a4">{details}</small>'
+                f'{percent}{badges}')
+        if node.children:
+            item += '<ul>' + ''.join(render(child) for child in node.children) + '</ul>'
+        return item + '</li>'
+
+    if metric == 'time':
+        legend = _('Rows are shown as estimated / actual. Shading marks the share of the total time spent in each node.')
+    else:
+        legend = _('Rows are shown as estimated / actual. Shading marks the share of the total cost spent in each node.')
+    output = f'<p><small>{html.escape(legend)}</small></p>'
+    output += f'<ul style="text-align:left;font-family:monospace">{render(root)}</ul>'
+    if suggestions:
+        title = _('Candidate indexes')
+        statements = '<br>'.join(html.escape(statement) for statement in suggestions)
+        output += f'<p><b>{title}</b></p><pre>{statements}</pre>'
+    return output
+
+
+def render_text(root, suggestions):
+    """Renders the plan tree as indented plain text."""
+    metric = hotspot_metric(root)
+    labels = warning_labels()
+    total = sum(node.self_weight(metric) for _depth, node in root.walk()) or 1.0
+    lines = []
+    for depth, node in root.walk():
+        line = '    ' * depth + '-> ' + node.label
+        details = node_details(node)
+        share = node.self_weight(metric) / total
+        if share >= 0.01:
+            details.append(f'{share:.0%}')
+        if details:
+            line += '  (' + ' '.join(details) + ')'
+        if node.warnings:
+            line += '  [' + ', '.join(labels[warning] for warning in node.warnings) + ']'
+        lines.append(line)
+    if suggestions:
+        lines.append('')
+        lines.append(_('Candidate indexes') + ':')
+        lines.extend(suggestions)
+    return '\n'.join(lines)
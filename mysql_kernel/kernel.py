@@ -2,7 +2,13 @@ import pandas as pd
 import sqlalchemy as sa
 from ipykernel.kernelbase import Kernel
 import re
+import html
+import uuid
+from contextlib import closing
 from .autocomplete import SQLAutocompleter
+from .chunked import ChunkedExecutor, parse_chunked_options
+from .pipeline import StatementPipeline, PipelineError, is_pipelinable, parse_pipeline_options
+from .explain import explain_query, suggest_indexes, render_html, render_text
 import logging
 import traceback
 from pygments import highlight
@@ -44,11 +50,12 @@ class MysqlKernel(Kernel):
     def __init__(self, **kwargs):
         Kernel.__init__(self, **kwargs)
         self.engine = False
+        self.statement_pipeline = None
         self.log.setLevel(logging.DEBUG)
         print(_('Mysql kernel initialized'))
         self.log.info(_('Mysql kernel initialized'))
         
-    def output(self, output, plain_text = None):
+    def output(self, output, plain_text = None, display_id = None, update = False):
         if plain_text == None:
             plain_text = output
         if not self.silent:
@@ -58,7 +65,9 @@ class MysqlKernel(Kernel):
                                    'text/plain': plain_text,
                                 },
                                'metadata': {}}
-            self.send_response(self.iopub_socket, 'display_data', display_content)
+            if display_id is not None:
+                display_content['transient'] = {'display_id': display_id}
+            self.send_response(self.iopub_socket, 'update_display_data' if update else 'display_data', display_content)
     
     def ok(self):
         return {'status':'ok', 'execution_count':self.execution_count, 'payload':[], 'user_expressions':{}}
@@ -122,20 +131,129 @@ class MysqlKernel(Kernel):
         self.autocompleter = SQLAutocompleter(engine=self.engine, log=self.log)
         return self.generic_ddl(query, _('Changed to database %s successfully.'))
 
+    def explain(self, query):
+        match = re.match(r'%explain\s+(analyze\s+)?(.+)', query, re.IGNORECASE | re.DOTALL)
+        if not match:
+            usage = _('Usage: %explain [analyze] <query>')
+            self.output(html.escape(usage), plain_text=usage)
+            return
+        analyze, query = bool(match.group(1)), match.group(2)
+        try:
+            plan = explain_query(self.engine, query, analyze=analyze)
+            suggestions = suggest_indexes(plan, query, self.autocompleter)
+            output = f'''<div style='max-height: 500px; overflow: auto; width: 100%'>{render_html(plan, suggestions)}</div>'''
+            self.output(output, plain_text=render_text(plan, suggestions))
+        except Exception as msg:
+            return self.handle_error(msg)
+
+    def chunk_progress(self, statement, state):
+        msg = _('Chunk %d: %d rows affected, last chunk took %.2fs, next chunk size %d, up to key %s.') % (
+            state['chunks'], state['rows'], state['elapsed'], state['size'], state['last_key'])
+        if state['progress'] is not None:
+            msg += f" ({state['progress']:.0%})"
+        if state.get('waiting'):
+            msg += ' ' + _('Waiting for the replica lag (%.0fs) to go down.') % state['lag']
+        return f'{statement}\n{msg}'
+
+    def chunked(self, code):
+        first_line, body = (code.split('\n', 1) + [''])[:2]
+        statements = [re.sub('\n* *--.*\n', '', v).strip() for v in body.split(';')]
+        # The executors count their committed rows as they go, so an interruption reports them exactly
+        executors = []
+        try:
+            options = parse_chunked_options(first_line)
+            for statement in [v for v in statements if v]:
+                executor = ChunkedExecutor(self.engine, statement, self.autocompleter,
+                                           size=options['size'], sleep=options['sleep'], target=options['target'],
+                                           max_size=options['max-size'], max_lag=options['max-lag'],
+                                           replica=options['replica'])
+                executors.append(executor)
+                display_id = uuid.uuid4().hex
+                self.output(html.escape(statement), plain_text=statement, display_id=display_id)
+                state = {'rows': 0, 'chunks': 0}
+                # Closing the generator on interruption disposes the replica engine right away
+                with closing(executor.run()) as chunks:
+                    for state in chunks:
+                        progress = self.chunk_progress(statement, state)
+                        self.output(html.escape(progress).replace('\n', '<br>'), plain_text=progress,
+                                    display_id=display_id, update=True)
+                msg = _('Done: %d rows affected in %d chunks.') % (executor.rows, state['chunks'])
+                self.output(f'{html.escape(statement)}<br>{msg}', plain_text=f'{statement}\n{msg}', display_id=display_id, update=True)
+            return self.ok()
+        except KeyboardInterrupt:
+            msg = _('Interrupted, %d rows affected by the committed chunks.') % sum(executor.rows for executor in executors)
+            self.output(msg)
+            return self.err(msg)
+        except Exception as msg:
+            return self.handle_error(msg)
+
+    def run_batch(self, statements):
+        if self.statement_pipeline is None or self.statement_pipeline.engine is not self.engine:
+            if self.statement_pipeline is not None:
+                self.statement_pipeline.dispose()
+            self.statement_pipeline = StatementPipeline(self.engine)
+        error = None
+        try:
+            rowcounts = self.statement_pipeline.run(statements)
+            statuses = [_('ok')] * len(rowcounts)
+        except PipelineError as e:
+            error = e
+            index = min(e.index, len(statements) - 1)
+            rowcounts = e.rowcounts[:index] + [''] * (len(statements) - index)
+            committed = min(e.committed, index)
+            statuses = ([_('ok')] * committed + [_('rolled back')] * (index - committed) + [_('error')]
+                        + [_('not executed')] * (len(statements) - index - 1))
+        except Exception as e:
+            return self.handle_error(e)
+        shorten = lambda statement: re.sub(r'\s+', ' ', statement)[:80]
+        summary = pd.DataFrame({
+            _('Statement'): [shorten(statement) for statement in statements],
+            _('Rows affected'): rowcounts,
+            _('Status'): statuses,
+        })
+        output = f'''<div style='max-height: 500px; overflow: auto; width: 100%'>{summary.to_html()}</div>'''
+        self.output(output, plain_text=summary.to_string())
+        if error:
+            return self.handle_error(error)
+
     def do_execute(self, code, silent, store_history=True, user_expressions=None, allow_stdin=False):
         self.silent = silent
         res = {}
         output = ''
         if not code.strip():
             return self.ok()
+        if code.lstrip().startswith('%%chunked'):
+            if self.engine == False:
+                self.output(_('Please connect to a database first!'))
+                return self.ok()
+            return self.chunked(code.lstrip())
+        pipeline = None
+        if code.lstrip().startswith('%%pipeline'):
+            first_line, code = (code.lstrip().split('\n', 1) + [''])[:2]
+            try:
+                pipeline = parse_pipeline_options(first_line)
+            except Exception as e:
+                return self.handle_error(e)
         sql = code.rstrip()+('' if code.rstrip().endswith(";") else ';')
         results_raw = None
+        batch = []
         try:
             for v in sql.split(";"):
                 v = v.rstrip()
                 v = re.sub('^[ \r\n\t]+', '', v)
                 v = re.sub('\n* *--.*\n', '', v) # remove comments
                 l = v.lower()
+                if pipeline and self.engine and is_pipelinable(l):
+                    batch.append(v)
+                    if len(batch) == pipeline['batch']:
+                        res, batch = self.run_batch(batch), []
+                        if res:
+                            return res
+                    continue
+                if batch:
+                    res, batch = self.run_batch(batch), []
+                    if res:
+                        return res
                 if len(l)>0:
                     if re.search(r'\w+://', l):
                         if l.count('@')>1:
@@ -167,6 +285,8 @@ class MysqlKernel(Kernel):
                         res = self.use_db(v)
                     elif l.startswith('insert into '):
                         res = self.insert_into(v)
+                    elif l.startswith('%explain'):
+                        res = self.explain(v)
                     else:
                         if self.engine:
                             v = re.sub('(?<!%)%(?!%)', '%%', v)
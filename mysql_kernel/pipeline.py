@@ -0,0 +1,163 @@
+import re
+import sqlalchemy as sa
+from .i18n import get_translator
+
+_ = get_translator()
+
+__all__ = ['StatementPipeline', 'PipelineError', 'is_pipelinable', 'parse_pipeline_options']
+
+DEFAULT_BATCH_SIZE = 100
+
+# Statements that never return rows and can be sent together
+PIPELINABLE = ('insert', 'update', 'delete', 'replace', 'create', 'drop', 'alter', 'truncate', 'rename')
+# Statements that commit implicitly on MySQL, even inside a transaction
+DDL = ('create', 'drop', 'alter', 'truncate', 'rename')
+# Dialects whose DDL statements commit implicitly
+IMPLICIT_COMMIT_DIALECTS = ('mysql', 'mariadb')
+
+
+def is_ddl(statement):
+    return statement.lower().split(None, 1)[0] in DDL
+
+
+def is_pipelinable(statement):
+    """Returns whether a (lowercase) statement can be batched with its neighbours."""
+    words = statement.split(None, 1)
+    return bool(words) and words[0] in PIPELINABLE
+
+
+def parse_pipeline_options(line):
+    """
+    Parses the options of a `%%pipeline` line.
+
+    Returns:
+    - dict: `batch`, the maximum number of statements per round trip.
+    """
+    options = {'batch': DEFAULT_BATCH_SIZE}
+    rest = re.sub(r'^\s*%%pipeline', '', line)
+    for name, value in re.findall(r'--([\w-]+)(?:[ =]+(\S+))?', rest):
+        if name != 'batch':
+            raise ValueError(_('Unknown %%%%pipeline option: --%s') % name)
+        if not value or not value.isdigit() or int(value) < 1:
+            raise ValueError(_('--batch must be a positive number of statements'))
+        options['batch'] = int(value)
+    return options
+
+
+class PipelineError(Exception):
+    """
+    Raised when a statement of a batch fails.
+
+    Attributes:
+    - index (int): Position of the failing statement in the batch.
+    - rowcounts (list): Rows affected by the statements before it.
+    - committed (int): How many of those statements were committed, the others were rolled back.
+    """
+
+    def __init__(self, error, index, rowcounts, committed):
+        super().__init__(str(error))
+        self.error = error
+        self.index = index
+        self.rowcounts = rowcounts
+        self.committed = committed
+
+
+class StatementPipeline:
+    """
+    Sends batches of statements over a single connection.
+
+    On pymysql the whole batch goes in one round trip using multi-statement support,
+    statements are committed as they run (like the kernel's AUTOCOMMIT engine) and a
+    failure stops the rest of the batch. Other drivers run the batch inside a single
+    transaction, which is rolled back when a statement fails (except for what MySQL
+    DDL statements commit implicitly).
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.multi_engine = None
+        self.implicit_commit = engine.dialect.name in IMPLICIT_COMMIT_DIALECTS
+        if self.implicit_commit and engine.dialect.driver == 'pymysql':
+            from pymysql.constants import CLIENT
+            # connect_args replaces the dialect's client_flag (FOUND_ROWS), which keeps UPDATE row counts as matched rows
+            client_flag = engine.dialect.create_connect_args(engine.url)[1].get('client_flag', 0)
+            self.multi_engine = sa.create_engine(engine.url, isolation_level='AUTOCOMMIT',
+                                                 connect_args={'client_flag': client_flag | CLIENT.MULTI_STATEMENTS})
+
+    def dispose(self):
+        """Closes the connections of the multi-statement engine, if any."""
+        if self.multi_engine is not None:
+            self.multi_engine.dispose()
+
+    def run(self, statements):
+        """
+        Executes a batch of statements.
+
+        Returns:
+        - list: Rows affected by each statement.
+        """
+        if self.multi_engine is not None:
+            return self.run_multi_statement(statements)
+        return self.run_transaction(statements)
+
+    def run_multi_statement(self, statements):
+        rowcounts = []
+        con = self.multi_engine.raw_connection()
+        try:
+            cursor = con.cursor()
+            try:
+                cursor.execute(';\n'.join(statements))
+                rowcounts.append(max(cursor.rowcount, 0))
+                while len(rowcounts) < len(statements) and cursor.nextset():
+                    rowcounts.append(max(cursor.rowcount, 0))
+            except Exception as e:
+                raise PipelineError(e, len(rowcounts), rowcounts, committed=len(rowcounts))
+            finally:
+                cursor.close()
+        finally:
+            con.close()
+        return rowcounts
+
+    def run_transaction(self, statements):
+        rowcounts = []
+        with self.engine.connect() as con:
+            # The kernel connects in AUTOCOMMIT (except for DuckDB), where begin() is a no-op,
+            # so the transaction is driven explicitly. This also keeps pysqlite from committing DDL.
+            explicit = self.engine.dialect.name != 'duckdb'
+            transaction = None if explicit else con.begin()
+            try:
+                if explicit:
+                    con.execute(sa.sql.text('BEGIN'))
+                for statement in statements:
+                    result = con.execute(sa.sql.text(statement))
+                    rowcounts.append(max(result.rowcount, 0))
+                    if explicit and self.implicit_commit and is_ddl(statement):
+                        # The implicit commit ends the transaction and the session goes back to autocommit
+                        con.execute(sa.sql.text('BEGIN'))
+                if explicit:
+                    con.execute(sa.sql.text('COMMIT'))
+                else:
+                    transaction.commit()
+            except Exception as e:
+                if explicit:
+                    con.execute(sa.sql.text('ROLLBACK'))
+                else:
+                    transaction.rollback()
+                index = len(rowcounts)
+                raise PipelineError(e, index, rowcounts, committed=self.committed_before(statements, index))
+        return rowcounts
+
+    def committed_before(self, statements, index):
+        """
+        Returns how many statements before `index` survive the rollback of the batch.
+
+        MySQL has no transactional DDL: each DDL statement commits everything before it,
+        and itself once it succeeds. `run_transaction` starts a new transaction after it.
+        """
+        committed = 0
+        if not self.implicit_commit:
+            return committed
+        for i, statement in enumerate(statements[:index + 1]):
+            if is_ddl(statement):
+                committed = i if i == index else i + 1
+        return committed
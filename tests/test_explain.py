@@ -0,0 +1,63 @@
+from mysql_kernel.explain import parse_mysql_json
+
+
+def shares(root):
+    total = sum(node.self_weight('cost') for _depth, node in root.walk())
+    return {node.label: node.self_weight('cost') / total for _depth, node in root.walk()}
+
+
+def test_mysql_json_sort_cost_is_not_cumulative():
+    document = {
+        'query_block': {
+            'select_id': 1,
+            'cost_info': {'query_cost': '101.00'},
+            'ordering_operation': {
+                'using_filesort': True,
+                'cost_info': {'sort_cost': '1.00'},
+                'table': {
+                    'table_name': 'orders',
+                    'access_type': 'ALL',
+                    'rows_examined_per_scan': 1000,
+                    'rows_produced_per_join': 1000,
+                    'filtered': '100.00',
+                    'cost_info': {'read_cost': '0.50', 'eval_cost': '99.50', 'prefix_cost': '100.00',
+                                  'data_read_per_join': '1M'},
+                    'used_columns': ['id', 'status', 'created_at'],
+                },
+            },
+        },
+    }
+    root = parse_mysql_json(document)
+    sort = root.children[0]
+    assert sort.cost == 101.0
+    result = shares(root)
+    assert result['query block'] == 0.0
+    assert abs(result['ordering operation'] - 1 / 101) < 1e-9
+    assert abs(result['orders (ALL)'] - 100 / 101) < 1e-9
+
+
+def test_mysql_json_materialized_table_includes_subquery():
+    document = {
+        'query_block': {
+            'cost_info': {'query_cost': '30.00'},
+            'table': {
+                'table_name': 'derived',
+                'access_type': 'ALL',
+                'cost_info': {'read_cost': '5.00', 'eval_cost': '5.00'},
+                'materialized_from_subquery': {
+                    'query_block': {
+                        'cost_info': {'query_cost': '20.00'},
+                        'table': {
+                            'table_name': 'orders',
+                            'access_type': 'ALL',
+                            'cost_info': {'read_cost': '10.00', 'eval_cost': '10.00'},
+                        },
+                    },
+                },
+            },
+        },
+    }
+    root = parse_mysql_json(document)
+    derived = root.children[0]
+    assert derived.cost == 30.0
+    assert derived.self_weight('cost') == 10.0